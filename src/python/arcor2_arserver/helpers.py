@@ -1,9 +1,10 @@
+import asyncio
 from contextlib import asynccontextmanager
-from typing import AsyncGenerator
+from typing import AsyncGenerator, Awaitable, Callable
 
 from arcor2.exceptions import Arcor2Exception
 from arcor2_arserver import globals as glob
-from arcor2_arserver.decorators import retry
+from arcor2_arserver import logger
 from arcor2_arserver.lock.common import ObjIds, obj_ids_to_list
 from arcor2_arserver.lock.exceptions import CannotLock, LockingException
 
@@ -27,16 +28,36 @@ def make_name_unique(orig_name: str, names: set[str]) -> str:
     return name
 
 
+async def _lock(lock: Callable[[ObjIds, str], Awaitable[bool]], obj_ids: ObjIds, owner: str) -> None:
+    """Calls the locking method until it succeeds or number of retries is
+    exceeded.
+
+    :param lock: glob.LOCK.write_lock or glob.LOCK.read_lock
+    :param obj_ids:
+    :param owner:
+    :return:
+    """
+
+    tries = glob.LOCK._lock_retries
+
+    for attempt in range(1, tries + 1):
+        if await lock(obj_ids, owner):
+            if attempt - 1 > tries * 0.25:
+                logger.warn(f"Retry timeout took {(attempt - 1) * glob.LOCK._retry_wait}")
+            return
+
+        if attempt < tries:
+            await asyncio.sleep(glob.LOCK._retry_wait)
+
+    logger.warn("Retry raised")
+    raise CannotLock(glob.LOCK.ErrMessages.LOCK_FAIL.value)
+
+
 @asynccontextmanager
 async def ctx_write_lock(
     obj_ids: ObjIds, owner: str, auto_unlock: bool = True, dry_run: bool = False
 ) -> AsyncGenerator[None, None]:
-    @retry(exc=CannotLock, tries=glob.LOCK._lock_retries, delay=glob.LOCK._retry_wait)
-    async def lock():
-        if not await glob.LOCK.write_lock(obj_ids, owner):
-            raise CannotLock(glob.LOCK.ErrMessages.LOCK_FAIL.value)
-
-    await lock()
+    await _lock(glob.LOCK.write_lock, obj_ids, owner)
     try:
         yield
     except Arcor2Exception:
@@ -62,18 +83,13 @@ async def ctx_read_lock(
     :return:
     """
 
-    @retry(exc=CannotLock, tries=glob.LOCK._lock_retries, delay=glob.LOCK._retry_wait)
-    async def lock() -> None:
-        if not await glob.LOCK.read_lock(obj_ids, owner):
-            raise CannotLock(glob.LOCK.ErrMessages.LOCK_FAIL.value)
-
     already_locked = False
 
     obj_ids = obj_ids_to_list(obj_ids)
 
     for obj_id in obj_ids:
         if not (await glob.LOCK.is_read_locked(obj_id, owner) or await glob.LOCK.is_write_locked(obj_id, owner)):
-            await lock()
+            await _lock(glob.LOCK.read_lock, obj_ids, owner)
             break
     else:
         already_locked = True
@@ -109,4 +125,4 @@ async def get_unlocked_objects(obj_ids: ObjIds, owner: str) -> set[str]:
     :return: list of objects that are not write locked
     """
 
-    return {obj_id for obj_id in obj_ids_to_list(obj_ids) if not await glob.LOCK.is_write_locked(obj_id, owner)}
+    return {obj_id for obj_id, locked in (await glob.LOCK.are_write_locked(obj_ids, owner)).items() if not locked}
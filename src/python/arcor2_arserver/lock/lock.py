@@ -313,6 +313,22 @@ class Lock:
         async with self._lock:
             return self._is_write_locked(root_id, obj_id, owner, check_tree_locked)
 
+    async def are_write_locked(self, obj_ids: ObjIds, owner: str) -> dict[str, bool]:
+        """Checks if objects are write locked, lock is acquired only once.
+
+        :param obj_ids: object identifiers to check
+        :param owner: lock owner name
+        :return: mapping of object identifiers to their write lock state
+        """
+
+        obj_ids = obj_ids_to_list(obj_ids)
+        roots = [await self.get_root_id(obj_id) for obj_id in obj_ids]
+
+        async with self._lock:
+            return {
+                obj_id: self._is_write_locked(root_id, obj_id, owner, False) for root_id, obj_id in zip(roots, obj_ids)
+            }
+
     def _is_write_locked(self, root_id: str, obj_id: str, owner: str, check_tree_locked: bool) -> bool:
         """Private method when lock is already acquired."""
 
@@ -1000,6 +1000,7 @@ async def copy_action_point_cb(req: srpc.p.CopyActionPoint.Request, ui: WsClient
             assert await glob.LOCK.is_read_locked(act.id, user_name)
             new_act = act.copy()
             new_act.name = make_name_unique(f"{act.name}_copy", action_names)
+            action_names.add(new_act.name)
             proj.upsert_action(ap.id, new_act)
             new_action_ids.add(new_act.id)
 
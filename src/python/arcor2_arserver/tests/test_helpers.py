@@ -0,0 +1,21 @@
+import pytest
+
+from arcor2.exceptions import Arcor2Exception
+from arcor2_arserver.helpers import make_name_unique, unique_name
+
+
+def test_unique_name() -> None:
+    unique_name("name", {"other"})
+
+    with pytest.raises(Arcor2Exception):
+        unique_name("", set())
+
+    with pytest.raises(Arcor2Exception):
+        unique_name("name", {"name"})
+
+
+def test_make_name_unique() -> None:
+    assert make_name_unique("name", set()) == "name"
+    assert make_name_unique("name", {"name"}) == "name_1"
+    assert make_name_unique("name", {"name", "name_1", "name_3"}) == "name_2"
+
@@ -105,6 +105,24 @@ async def test_base_logic(lock: Lock) -> None:
     assert not lock._locked_objects
 
 
+@pytest.mark.asyncio()
+async def test_are_write_locked(lock: Lock) -> None:
+    assert lock.project
+
+    test = "test"
+    ap = next(ap for ap in lock.project.action_points if ap.name == "ap")
+    ap2 = next(ap for ap in lock.project.action_points if ap.name == "ap2")
+
+    assert await lock.are_write_locked([ap.id, ap2.id], test) == {ap.id: False, ap2.id: False}
+
+    await lock.write_lock(ap.id, test)
+    assert await lock.are_write_locked([ap.id, ap2.id], test) == {ap.id: True, ap2.id: False}
+    assert await lock.are_write_locked(ap.id, "second_user") == {ap.id: False}
+    await lock.write_unlock(ap.id, test)
+
+    assert not lock._locked_objects
+
+
 @pytest.mark.asyncio()
 async def test_locking_unknown_id(lock: Lock) -> None:
     assert lock.project
@@ -2,18 +2,23 @@
 
 import argparse
 import ast
+import concurrent.futures
+import hashlib
 import logging
 import os
 import sys
 import tempfile
+import unicodedata
 import zipfile
 from datetime import datetime, timezone
-from io import BytesIO
-from typing import TypeVar
+from io import BufferedWriter, BytesIO, RawIOBase
+from typing import TYPE_CHECKING, Iterator, TypeVar
+from urllib.parse import quote
 
 import humps
 from dataclasses_jsonschema import JsonSchemaMixin, ValidationError
-from flask import request, send_file
+from flask import Response, request
+from werkzeug.datastructures import ETags, Headers
 
 import arcor2_build
 
@@ -23,9 +28,9 @@ import arcor2_runtime.resources  # noqa
 from arcor2 import env, json
 from arcor2.cached import CachedProject, CachedScene
 from arcor2.clients import project_service as ps
-from arcor2.data.common import Project, ProjectSources, Scene
+from arcor2.data.common import IdDesc, Project, ProjectSources, Scene
 from arcor2.data.execution import PackageMeta
-from arcor2.data.object_type import Models, ObjectModel, ObjectType
+from arcor2.data.object_type import Model, Models, ObjectModel, ObjectType
 from arcor2.exceptions import Arcor2Exception
 from arcor2.flask import RespT, create_app, run_app
 from arcor2.helpers import port_from_url, save_and_import_type_def
@@ -41,27 +46,110 @@ from arcor2_build.source.utils import global_action_points_class
 from arcor2_build_data import DEPENDENCIES, SERVICE_NAME, URL, ImportResult
 from arcor2_build_data.exceptions import Conflict, InvalidPackage, InvalidProject, NotFound, WebApiError
 
+if TYPE_CHECKING:
+    from _typeshed import ReadableBuffer
+
 OBJECT_TYPE_MODULE = "arcor2_object_types"
 
+# given by the installed arcor2 package, so there is no need to enumerate them again and again
+BUILT_IN_TYPES = frozenset(built_in_types_names())
+
 original_sys_path = list(sys.path)
 original_sys_modules = dict(sys.modules)
 
 logger = get_logger("Build")
 
+# the package consists mostly of small Python/JSON files, where the fastest level gives almost the same ratio
+COMPRESSION_LEVEL = env.get_int("ARCOR2_BUILD_COMPRESSION_LEVEL", 1)
+
+if not 0 <= COMPRESSION_LEVEL <= 9:  # otherwise it would fail when the response is already being sent
+    raise env.Arcor2EnvException(f"Variable ARCOR2_BUILD_COMPRESSION_LEVEL has invalid value: {COMPRESSION_LEVEL}.")
+
+# do not open more connections to the Project service than urllib3 keeps in its pool (10 per host by default)
+PROJECT_SERVICE_WORKERS = 10
+
 app = create_app(__name__)
 
+# path within the package -> content
+PackageFiles = dict[str, str]
+
+
+class _ZipStream(RawIOBase):
+    """Write-only (not seekable) binary stream, collects output of ZipFile
+    until it is drained."""
+
+    def __init__(self) -> None:
+        super().__init__()
+        self._chunks: list[bytes] = []
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data: "ReadableBuffer") -> int:
+        chunk = bytes(data)
+        self._chunks.append(chunk)
+        return len(chunk)
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def _attachment_headers(download_name: str) -> Headers:
+    """Builds headers for a downloaded file the same way as werkzeug's
+    send_file does (ASCII fallback + RFC 5987 encoded name)."""
+
+    try:
+        download_name.encode("ascii")
+    except UnicodeEncodeError:
+        simple = unicodedata.normalize("NFKD", download_name).encode("ascii", "ignore").decode("ascii")
+        # safe = RFC 5987 attr-char
+        quoted = quote(download_name, safe="!#$&+-.^_`|~")
+        names = {"filename": simple, "filename*": f"UTF-8''{quoted}"}
+    else:
+        names = {"filename": download_name}
+
+    headers = Headers()
+    headers.set("Content-Disposition", "attachment", **names)
+    headers.set("Cache-Control", "no-cache")
+    return headers
+
+
+def _stream_zip(files: PackageFiles) -> Iterator[bytes]:
+    """Compresses files into zip archive, yields chunks of the archive as they
+    are produced."""
+
+    stream = _ZipStream()
+
+    with BufferedWriter(stream) as writer, zipfile.ZipFile(
+        writer, mode="w", compression=zipfile.ZIP_DEFLATED, compresslevel=COMPRESSION_LEVEL
+    ) as zf:
+        for path, content in files.items():
+            zf.writestr(path, content)
+            writer.flush()
+            yield stream.drain()
+
+    yield stream.drain()
+
+
+def _get_model(obj_type: ObjectType) -> Model:
+    assert obj_type.model
+    logger.debug(f"Getting model {obj_type.model.id} of {obj_type.id}.")
+    return ps.get_model(obj_type.model.id, obj_type.model.type)
+
 
 def get_base_from_project_service(
     types_dict: TypesDict,
     tmp_dir: str,
     scene_object_types: set[str],
     obj_type: ObjectType,
-    zf: zipfile.ZipFile,
+    files: PackageFiles,
     ot_path: str,
     ast: ast.AST,
 ) -> None:
     for idx, base in enumerate(base_from_source(ast, obj_type.id)):
-        if base in types_dict.keys() | built_in_types_names() | scene_object_types:
+        if base in types_dict or base in BUILT_IN_TYPES or base in scene_object_types:
             continue
 
         logger.debug(f"Getting {base} as base of {obj_type.id}.")
@@ -74,7 +162,7 @@ def get_base_from_project_service(
             raise InvalidPackage(f"Invalid code of the {base_obj_type.id} (base of {obj_type.id}).")
 
         # try to get base of the base
-        get_base_from_project_service(types_dict, tmp_dir, scene_object_types, base_obj_type, zf, ot_path, base_ast)
+        get_base_from_project_service(types_dict, tmp_dir, scene_object_types, base_obj_type, files, ot_path, base_ast)
 
         if idx == 0:  # this is the base ObjectType
             types_dict[base_obj_type.id] = save_and_import_type_def(
@@ -84,14 +172,14 @@ def get_base_from_project_service(
             save_and_import_type_def(base_obj_type.source, base_obj_type.id, object, tmp_dir, OBJECT_TYPE_MODULE)
             scene_object_types.add(base_obj_type.id)
 
-        zf.writestr(os.path.join(ot_path, humps.depascalize(base_obj_type.id)) + ".py", base_obj_type.source)
+        files[os.path.join(ot_path, humps.depascalize(base_obj_type.id)) + ".py"] = base_obj_type.source
 
 
 def get_base_from_imported_package(
     obj_type: ObjectType, types_dict: dict[str, ObjectType], zip_file: zipfile.ZipFile, tmp_dir: str, ast: ast.AST
 ) -> None:
     for idx, base in enumerate(base_from_source(ast, obj_type.id)):
-        if base in types_dict.keys() | built_in_types_names():
+        if base in types_dict or base in BUILT_IN_TYPES:
             continue
 
         logger.debug(f"Getting {base} as base of {obj_type.id}.")
@@ -119,12 +207,44 @@ def get_base_from_imported_package(
             save_and_import_type_def(base_obj_type_src, base, object, tmp_dir, OBJECT_TYPE_MODULE)
 
 
-def _publish(project_id: str, package_name: str) -> RespT:
-    mem_zip = BytesIO()
+def _package_etag(package_name: str, files: PackageFiles, obj_types: list[IdDesc], script: None | str) -> str:
+    """Computes ETag of the package from what its content is generated from,
+    without fetching ObjectTypes and models.
+
+    The timestamp in package.json is not taken into account. All
+    ObjectTypes are considered as there is no way to tell which of them
+    are bases of the scene ones without importing them. Models are
+    covered by modification time of their ObjectType, which is always
+    updated together with the model.
+
+    :param package_name:
+    :param files: data files (project, scene) already added to the package
+    :param obj_types: all ObjectTypes on the Project service
+    :param script: the main script from the Project service (if any)
+    :return:
+    """
+
+    parts = [arcor2_build.version(), package_name]
+    parts.extend(f"{path}:{content}" for path, content in sorted(files.items()))
+    parts.extend(f"{obj_type.id}:{obj_type.modified}" for obj_type in sorted(obj_types, key=lambda ot: ot.id))
+
+    if script is not None:
+        parts.append(script)
+
+    return hashlib.sha256("|".join(parts).encode()).hexdigest()
 
+
+def _not_modified(etag: str) -> Response:
+    resp = Response(status=304)
+    resp.set_etag(etag, weak=True)
+    return resp
+
+
+def _publish(project_id: str, package_name: str, if_none_match: ETags) -> RespT:
     logger.debug(f"Generating package {package_name} for project_id: {project_id}.")
 
     types_dict: TypesDict = {}
+    files: PackageFiles = {}
 
     # restore original environment
     sys.path = list(original_sys_path)
@@ -133,104 +253,128 @@ def _publish(project_id: str, package_name: str) -> RespT:
     with tempfile.TemporaryDirectory() as tmp_dir:
         prepare_object_types_dir(tmp_dir, OBJECT_TYPE_MODULE)
 
-        with zipfile.ZipFile(mem_zip, mode="w", compression=zipfile.ZIP_DEFLATED) as zf:
-            try:
-                logger.debug("Getting scene and project.")
-                project = ps.get_project(project_id)
-                cached_project = CachedProject(project)
-                scene = ps.get_scene(project.scene_id)
-                cached_scene = CachedScene(scene)
+        try:
+            logger.debug("Getting scene and project.")
+            project = ps.get_project(project_id)
+            cached_project = CachedProject(project)
+            scene = ps.get_scene(project.scene_id)
+            cached_scene = CachedScene(scene)
 
-                if not package_name:
-                    package_name = project.name
+            if not package_name:
+                package_name = project.name
 
-                data_path = "data"
-                ot_path = "object_types"
+            data_path = "data"
+            ot_path = "object_types"
 
-                zf.writestr(os.path.join(ot_path, "__init__.py"), "")
-                zf.writestr(os.path.join(data_path, "project.json"), project.to_json())
-                zf.writestr(os.path.join(data_path, "scene.json"), scene.to_json())
+            files[os.path.join(ot_path, "__init__.py")] = ""
+            files[os.path.join(data_path, "project.json")] = json.dumps(project.to_dict())
+            files[os.path.join(data_path, "scene.json")] = json.dumps(scene.to_dict())
 
-                obj_types = set(cached_scene.object_types)
-                obj_types_with_models: set[str] = set()
+            obj_types = set(cached_scene.object_types)
 
-                for scene_obj in scene.objects:
-                    if scene_obj.type in types_dict:
-                        continue
+            # there might be more instances of the same type, keep order of the first appearance
+            obj_type_ids = list(dict.fromkeys(scene_obj.type for scene_obj in scene.objects))
 
-                    logger.debug(f"Getting scene object type {scene_obj.type}.")
-                    obj_type = ps.get_object_type(scene_obj.type)
+            module_names = {obj_type_id: humps.depascalize(obj_type_id) for obj_type_id in obj_type_ids}
 
-                    if obj_type.model and obj_type.id not in obj_types_with_models:
-                        obj_types_with_models.add(obj_type.id)
+            # requests to the Project service are independent, so let's do them in parallel
+            with concurrent.futures.ThreadPoolExecutor(max_workers=PROJECT_SERVICE_WORKERS) as executor:
+                all_obj_types = executor.submit(ps.get_object_type_ids)
+                project_sources = None if project.has_logic else executor.submit(ps.get_project_sources, project.id)
 
-                        model = ps.get_model(obj_type.model.id, obj_type.model.type)
-                        obj_model = ObjectModel(
-                            obj_type.model.type, **{model.type().value.lower(): model}  # type: ignore
-                        )
+                script: None | str = None
 
-                        zf.writestr(
-                            os.path.join(data_path, "models", humps.depascalize(obj_type.id) + ".json"),
-                            obj_model.to_json(),
-                        )
+                if project_sources is not None:
+                    try:
+                        script = project_sources.result().script
+                    except ps.ProjectServiceException:
+                        logger.info("Script not found on project service, creating one from scratch.")
 
-                    zf.writestr(os.path.join(ot_path, humps.depascalize(obj_type.id)) + ".py", obj_type.source)
+                # done before getting ObjectTypes and models, so they don't have to be fetched for unmodified package
+                etag: None | str = None
 
-                    # handle inheritance
-                    get_base_from_project_service(
-                        types_dict, tmp_dir, obj_types, obj_type, zf, ot_path, parse(obj_type.source)
-                    )
+                try:
+                    etag = _package_etag(package_name, files, all_obj_types.result(), script)
+                except ps.ProjectServiceException:
+                    logger.warning("Failed to list object types, the package will be sent without ETag.")
 
-                    types_dict[scene_obj.type] = save_and_import_type_def(
-                        obj_type.source, scene_obj.type, Generic, tmp_dir, OBJECT_TYPE_MODULE
-                    )
+                if etag is not None and if_none_match.contains_weak(etag):
+                    logger.info(f"Package {package_name} not modified.")
+                    return _not_modified(etag)
 
-            except Arcor2Exception as e:
-                logger.exception(f"Failed to prepare package content. {str(e)}")
-                raise NotFound(str(e))
+                logger.debug(f"Getting scene object types: {', '.join(obj_type_ids)}.")
 
-            script_path = "script.py"
+                scene_obj_types = list(executor.map(ps.get_object_type, obj_type_ids))
+                obj_types_with_models = [obj_type for obj_type in scene_obj_types if obj_type.model]
+                models = list(executor.map(_get_model, obj_types_with_models))
 
-            try:
-                if project.has_logic:
-                    logger.debug("Generating script from project logic.")
-                    zf.writestr(script_path, program_src(types_dict, cached_project, cached_scene, True))
-                else:
-                    try:
-                        logger.debug("Getting project sources.")
-                        script = ps.get_project_sources(project.id).script
+            for obj_type, model in zip(obj_types_with_models, models):
+                assert obj_type.model
+                obj_model = ObjectModel(obj_type.model.type, **{model.type().value.lower(): model})  # type: ignore
 
-                        # check if it is a valid Python code
-                        try:
-                            parse(script)
-                        except SourceException:
-                            logger.exception("Failed to parse code of the uploaded script.")
-                            raise InvalidProject("Invalid source code.")
+                files[os.path.join(data_path, "models", module_names[obj_type.id] + ".json")] = json.dumps(
+                    obj_model.to_dict()
+                )
 
-                        zf.writestr(script_path, script)
+            for obj_type in scene_obj_types:
+                if obj_type.id in types_dict:  # already imported as a base of another type
+                    continue
 
-                    except ps.ProjectServiceException:
-                        logger.info("Script not found on project service, creating one from scratch.")
+                files[os.path.join(ot_path, module_names[obj_type.id]) + ".py"] = obj_type.source
+
+                # handle inheritance
+                get_base_from_project_service(
+                    types_dict, tmp_dir, obj_types, obj_type, files, ot_path, parse(obj_type.source)
+                )
+
+                types_dict[obj_type.id] = save_and_import_type_def(
+                    obj_type.source, obj_type.id, Generic, tmp_dir, OBJECT_TYPE_MODULE
+                )
+
+        except Arcor2Exception as e:
+            logger.exception(f"Failed to prepare package content. {str(e)}")
+            raise NotFound(str(e))
+
+        script_path = "script.py"
 
-                        # write script without the main loop
-                        zf.writestr(script_path, program_src(types_dict, cached_project, cached_scene, False))
+        try:
+            if project.has_logic:
+                logger.debug("Generating script from project logic.")
+                files[script_path] = program_src(types_dict, cached_project, cached_scene, True)
+            elif script is not None:
+                # check if it is a valid Python code
+                try:
+                    parse(script)
+                except SourceException:
+                    logger.exception("Failed to parse code of the uploaded script.")
+                    raise InvalidProject("Invalid source code.")
 
-                logger.debug("Generating supplementary files.")
+                files[script_path] = script
+            else:
+                # write script without the main loop
+                files[script_path] = program_src(types_dict, cached_project, cached_scene, False)
 
-                logger.debug("action_points.py")
-                zf.writestr("action_points.py", global_action_points_class(cached_project))
+            logger.debug("Generating supplementary files.")
 
-                logger.debug("package.json")
-                zf.writestr("package.json", PackageMeta(package_name, datetime.now(tz=timezone.utc)).to_json())
+            logger.debug("action_points.py")
+            files["action_points.py"] = global_action_points_class(cached_project)
 
-            except Arcor2Exception as e:
-                logger.exception("Failed to generate script.")
-                raise InvalidProject(str(e))
+            logger.debug("package.json")
+            package_meta = PackageMeta(package_name, datetime.now(tz=timezone.utc))
+            files["package.json"] = json.dumps(package_meta.to_dict())
+
+        except Arcor2Exception as e:
+            logger.exception("Failed to generate script.")
+            raise InvalidProject(str(e))
 
     logger.info(f"Done with {package_name} (scene {scene.name}, project {project.name}).")
-    mem_zip.seek(0)
 
-    return send_file(mem_zip, as_attachment=True, max_age=0, download_name=f"{package_name}_package.zip")
+    resp = Response(
+        _stream_zip(files), mimetype="application/zip", headers=_attachment_headers(f"{package_name}_package.zip")
+    )
+    if etag is not None:
+        resp.set_etag(etag, weak=True)  # package.json contains a timestamp, so the content is never the same
+    return resp
 
 
 @app.route("/project/publish", methods=["GET"])
@@ -255,6 +399,12 @@ def project_publish() -> RespT:
             type: string
           required: false
           description: Name to be used for package created.
+        - in: header
+          name: If-None-Match
+          schema:
+            type: string
+          required: false
+          description: ETag of a previously published package.
       responses:
         200:
           description: Returns archive of the execution package (.zip).
@@ -263,6 +413,8 @@ def project_publish() -> RespT:
                 schema:
                   type: string
                   format: binary
+        304:
+          description: The package would be the same as the one identified by If-None-Match.
         500:
           description: "Error types: **General**, **NotFound**, **InvalidProject**."
           content:
@@ -271,7 +423,7 @@ def project_publish() -> RespT:
                     $ref: WebApiError
     """
 
-    return _publish(request.args["projectId"], request.args.get("packageName", default=""))
+    return _publish(request.args["projectId"], request.args.get("packageName", default=""), request.if_none_match)
 
 
 T = TypeVar("T", bound=JsonSchemaMixin)
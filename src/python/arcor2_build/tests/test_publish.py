@@ -0,0 +1,160 @@
+import io
+import zipfile
+from datetime import datetime, timezone
+from types import ModuleType
+
+import pytest
+from flask.testing import FlaskClient
+from werkzeug.http import parse_options_header
+
+from arcor2.clients import project_service as ps
+from arcor2.data.common import IdDesc, Project, ProjectSources, Scene, SceneObject
+from arcor2.data.object_type import Box, Model, Model3dType, ObjectType
+
+
+@pytest.fixture()
+def build(monkeypatch: pytest.MonkeyPatch) -> ModuleType:
+    monkeypatch.setenv("ARCOR2_PROJECT_PATH", "")  # required by arcor2_runtime, not actually used
+    from arcor2_build.scripts import build
+
+    return build
+
+
+@pytest.fixture()
+def project() -> Project:
+    return Project("Projekt č. 1", Scene("Scéna").id, has_logic=False)
+
+
+@pytest.fixture()
+def client(monkeypatch: pytest.MonkeyPatch, build: ModuleType, project: Project) -> FlaskClient:
+    def get_object_type_ids() -> list[IdDesc]:
+        return []
+
+    monkeypatch.setattr(ps, "get_project", lambda project_id: project)
+    monkeypatch.setattr(ps, "get_scene", lambda scene_id: Scene("Scéna", id=scene_id))
+    monkeypatch.setattr(ps, "get_object_type_ids", get_object_type_ids)
+    monkeypatch.setattr(ps, "get_project_sources", lambda project_id: ProjectSources(project_id, "pass\n"))
+
+    return build.app.test_client()
+
+
+def test_publish_non_ascii_name(client: FlaskClient, project: Project) -> None:
+    resp = client.get("/project/publish", query_string={"projectId": project.id})
+    assert resp.status_code == 200
+
+    content_disposition = resp.headers["Content-Disposition"]
+    content_disposition.encode("latin-1")  # headers have to be encodable, otherwise the server fails to send them
+
+    value, options = parse_options_header(content_disposition)
+    assert value == "attachment"
+    assert options["filename"] == f"{project.name}_package.zip"
+
+    with zipfile.ZipFile(io.BytesIO(resp.data)) as zf:
+        assert zf.read("script.py") == b"pass\n"
+        assert "data/project.json" in zf.namelist()
+
+
+def test_publish_not_modified(client: FlaskClient, project: Project) -> None:
+    resp = client.get("/project/publish", query_string={"projectId": project.id})
+    assert resp.status_code == 200
+
+    etag, weak = resp.get_etag()
+    assert etag
+    assert weak
+
+    resp = client.get(
+        "/project/publish", query_string={"projectId": project.id}, headers={"If-None-Match": f'W/"{etag}"'}
+    )
+    assert resp.status_code == 304
+    assert resp.get_etag() == (etag, True)
+    assert not resp.data
+
+    resp = client.get(
+        "/project/publish", query_string={"projectId": project.id}, headers={"If-None-Match": 'W/"something-else"'}
+    )
+    assert resp.status_code == 200
+    assert resp.get_etag() == (etag, True)
+
+
+TESTER_SRC = """
+from arcor2.object_types.abstract import Generic
+
+
+class Tester(Generic):
+    _ABSTRACT = False
+"""
+
+BIG_BOX_SRC = """
+from arcor2.object_types.abstract import Generic
+
+
+class BigBox(Generic):
+    _ABSTRACT = False
+"""
+
+
+def test_publish_object_types(monkeypatch: pytest.MonkeyPatch, client: FlaskClient, project: Project) -> None:
+    box = Box("BigBox", 1, 2, 3)
+    obj_types = {
+        "Tester": ObjectType("Tester", TESTER_SRC),
+        "BigBox": ObjectType("BigBox", BIG_BOX_SRC, model=box.metamodel()),
+    }
+
+    obj_type_calls: list[str] = []
+    model_calls: list[str] = []
+
+    def get_object_type(object_type_id: str) -> ObjectType:
+        obj_type_calls.append(object_type_id)
+        return obj_types[object_type_id]
+
+    def get_model(model_id: str, model_type: Model3dType) -> Model:
+        model_calls.append(model_id)
+        assert model_type == Model3dType.BOX
+        return box
+
+    scene = Scene(
+        "Scéna",
+        objects=[SceneObject("t1", "Tester"), SceneObject("t2", "Tester"), SceneObject("b1", "BigBox")],
+        id=project.scene_id,
+    )
+
+    monkeypatch.setattr(ps, "get_scene", lambda scene_id: scene)
+    monkeypatch.setattr(ps, "get_object_type", get_object_type)
+    monkeypatch.setattr(ps, "get_model", get_model)
+
+    resp = client.get("/project/publish", query_string={"projectId": project.id})
+    assert resp.status_code == 200
+
+    assert sorted(obj_type_calls) == ["BigBox", "Tester"]
+    assert model_calls == ["BigBox"]
+
+    with zipfile.ZipFile(io.BytesIO(resp.data)) as zf:
+        assert set(zf.namelist()) == {
+            "object_types/__init__.py",
+            "object_types/tester.py",
+            "object_types/big_box.py",
+            "data/project.json",
+            "data/scene.json",
+            "data/models/big_box.json",
+            "script.py",
+            "action_points.py",
+            "package.json",
+        }
+        assert zf.read("object_types/big_box.py").decode() == BIG_BOX_SRC
+
+
+def test_package_etag(build: ModuleType) -> None:
+    now = datetime.now(tz=timezone.utc)
+    model_path = "data/models/box.json"
+
+    files = {"data/project.json": "{}", model_path: '{"type": "Box"}'}
+    obj_types = [IdDesc("Box", "Box", now, now)]
+
+    etag = build._package_etag("package", files, obj_types, "pass\n")
+
+    assert build._package_etag("package", dict(files), [IdDesc("Box", "Box", now, now)], "pass\n") == etag
+
+    assert build._package_etag("package", files, obj_types, "print()\n") != etag
+    assert build._package_etag("package", files, obj_types, None) != etag
+    assert build._package_etag("package", {**files, model_path: '{"type": "Cylinder"}'}, obj_types, "pass\n") != etag
+    assert build._package_etag("package", files, [IdDesc("Box", "Box", now, datetime.now())], "pass\n") != etag